@@ -5,6 +5,10 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import concurrent.futures
+import contextlib
+import io
+import os
 import typing
 from JackTokenizer import JackTokenizer
 from SymbolTable import SymbolTable
@@ -17,9 +21,11 @@ class CompilationEngine:
     """
     CONVERT_KIND = {
         'ARG': 'ARG',
+        'ARGUMENT': 'ARG',
         'STATIC': 'STATIC',
         'VAR': 'LOCAL',
-        'FIELD': 'THIS'
+        'FIELD': 'THIS',
+        'TEMP': 'TEMP'
     }
     ARITHMETIC = {
         '+': 'ADD',
@@ -31,6 +37,46 @@ class CompilationEngine:
         '|': 'OR'
     }
 
+    KEYWORD_CONSTANTS = {
+        'true': -1,
+        'false': 0,
+        'null': 0
+    }
+
+    BRACKETS = {
+        '(': ')',
+        '[': ']',
+        '{': '}'
+    }
+
+    # Binding strength of the binary operators when parsing with
+    # precedence. Jack itself evaluates them strictly left to right, which
+    # is what LEFT_TO_RIGHT encodes.
+    PRECEDENCE = {
+        '|': 0,
+        '&': 1,
+        '<': 2,
+        '>': 2,
+        '=': 2,
+        '+': 3,
+        '-': 3,
+        '*': 4,
+        '/': 4
+    }
+
+    LEFT_TO_RIGHT = dict.fromkeys(PRECEDENCE, 0)
+
+    # Self tail calls jump here, past the function's frame setup.
+    TAIL_CALL_LABEL = "TAIL_CALL"
+
+    # Temp slots that can hold the locals of subroutines making no calls.
+    # temp 0 is scratch space for let and do statements.
+    TEMP_LOCALS = range(1, 8)
+
+    # Uses of a local inside a while loop count this many times more than
+    # uses around it, per level of nesting.
+    LOOP_WEIGHT = 8
+
     ARITHMETIC_UNARY = {
         '-': 'NEG',
         '~': 'NOT',
@@ -38,32 +84,66 @@ class CompilationEngine:
         '#': 'SHIFTRIGHT'
     }
 
-    def __init__(self, input_stream: typing.TextIO, output_stream) -> None:
+    def __init__(self, input_stream: typing.IO, output_stream,
+                 memory_map: bool = False, precedence: bool = False,
+                 runtime: bool = False,
+                 source_map: typing.Optional[typing.TextIO] = None,
+                 first_line: int = 1, jobs: int = 1,
+                 pool: typing.Optional[concurrent.futures.Executor] = None
+                 ) -> None:
         """
         Creates a new compilation engine with the given input and output. The
         next routine called must be compileClass()
         :param input_stream: The input stream.
         :param output_stream: The output stream.
+        :param memory_map: Tokenize a memory-mapped view of the input file.
+        :param precedence: Parse binary operators by precedence instead of
+        strictly left to right.
+        :param runtime: Target the OS runtime shipped with the compiler, which
+        builds a string constant with a single String.newFrom call.
+        :param source_map: If given, maps the lines of the output stream back
+        to the lines of the input file, as described in VMWriter.
+        :param first_line: The line of the output stream the first command
+        lands on.
+        :param jobs: Compile the subroutines of the class in this many worker
+        processes.
+        :param pool: The pool of jobs worker processes to use, shared with
+        the other classes being compiled. If None, one is started for this
+        class.
         """
         # Your code goes here!
         # Note that you can write to output_stream like so:
         # output_stream.write("Hello world! \n")
-        tokenizer = JackTokenizer(input_stream)
+        tokenizer = JackTokenizer(input_stream, memory_map)
         self.all_tokens = []
         self.index = -1
         while tokenizer.has_more_tokens():
             tokenizer.advance()
-            self.all_tokens.append((tokenizer.current_value, tokenizer.current_type))
+            value, token_type = tokenizer.current_value, tokenizer.current_type
+            # Symbols and keywords are dispatched on by value, the rest by type.
+            kind = value if token_type in ("SYMBOL", "KEYWORD") else token_type
+            if source_map is None:
+                self.all_tokens.append((value, token_type, kind))
+            else:
+                self.all_tokens.append((value, token_type, kind,
+                                        tokenizer.line(), tokenizer.column()))
         self.size = len(self.all_tokens)
         self.table = SymbolTable()
-        self.vm = VMWriter(output_stream)
+        self.source_name = os.path.basename(getattr(input_stream, "name", ""))
+        self.vm = VMWriter(output_stream, source_map, self._location,
+                           first_line)
         self.clas_name = ""
         self.subroutine_name = ""
         self.subroutine_kind = ""
-        self.num_args = 0
-        self.func_name = ""
+        self.subroutine_start = 0
         self.while_index = -1
         self.if_index = -1
+        self.dead_stores = {}
+        self.entry_live = set()
+        self.precedence = self.PRECEDENCE if precedence else self.LEFT_TO_RIGHT
+        self.runtime = runtime
+        self.jobs = jobs
+        self.pool = pool
 
     def compile_class(self) -> None:
         """Compiles a complete class."""
@@ -75,11 +155,34 @@ class CompilationEngine:
             self.index += 1
             while self.all_tokens[self.index + 1][0] == "static" or self.all_tokens[self.index + 1][0] == "field":
                 self.compile_class_var_dec()
+            if self.jobs > 1:
+                self.compile_subroutines_in_parallel()
             while self.all_tokens[self.index + 1][0] == "constructor" or self.all_tokens[self.index + 1][
                 0] == "function" or \
                     self.all_tokens[self.index + 1][0] == "method":
                 self.compile_subroutine()
 
+    def compile_subroutines_in_parallel(self) -> None:
+        """Compiles all the subroutines of the class in a pool of jobs worker
+        processes, one work unit per subroutine. Labels are numbered per
+        subroutine, so the code is the same as when compiled in order, and
+        it is written in declaration order.
+        """
+        units = []
+        while self.all_tokens[self.index + 1][0] in ("constructor", "function", "method"):
+            start = self.index + 1
+            body = self._matching(start + 3) + 1
+            self.index = self._matching(body)
+            units.append((self.all_tokens[start:self.index + 2], self.clas_name,
+                          self.table, self.source_name, self.precedence,
+                          self.runtime, self.vm.source_map is not None))
+        chunk_size = max(1, len(units) // (self.jobs * 4))
+        with contextlib.nullcontext(self.pool) if self.pool is not None else \
+                concurrent.futures.ProcessPoolExecutor(self.jobs) as pool:
+            for code, code_map in pool.map(compile_subroutine_unit, units,
+                                           chunksize=chunk_size):
+                self.vm.write_code(code, code_map)
+
     def compile_class_var_dec(self) -> None:
         """Compiles a static declaration or a field declaration."""
         # Your code goes here!
@@ -105,7 +208,10 @@ class CompilationEngine:
         """
         # Your code goes here!
         self.table.start_subroutine()
+        self.while_index = -1
+        self.if_index = -1
         self.index += 1
+        self.subroutine_start = self.index
         self.subroutine_kind = self.all_tokens[self.index][0]
         if self.subroutine_kind == "method":
             self.table.define("this", self.clas_name, "ARG")
@@ -136,11 +242,20 @@ class CompilationEngine:
             self.table.define(self.all_tokens[self.index][0], type_of, "ARG")
 
     def compile_subroutine_body(self) -> None:
+        body_end = self._matching(self.index)
         while self.all_tokens[self.index + 1][0] == "var":
             self.compile_var_dec()
+        self.table.remove(self._dead_locals(self.index + 1, body_end))
+        self.table.promote(self._hot_locals(self.index + 1, body_end),
+                           self.TEMP_LOCALS[0])
+        # The entry code is located at the subroutine's declaration rather
+        # than at its last var declaration.
+        body_start = self.index
+        self.index = self.subroutine_start
         func_name = "{}.{}".format(self.clas_name, self.subroutine_name)
         num_locals = self.table.var_count("VAR")
         self.vm.write_function(func_name, num_locals)
+        self._clear_locals(("temp",))
         if self.subroutine_kind == "constructor":
             num_fields = self.table.var_count('FIELD')
             self.vm.write_push('CONST', num_fields)
@@ -149,6 +264,11 @@ class CompilationEngine:
         elif self.subroutine_kind == 'method':
             self.vm.write_push('ARG', 0)
             self.vm.write_pop('POINTER', 0)
+        if any(self._self_tail_call(i) is not None
+               for i in range(body_start, body_end)
+               if self.all_tokens[i][2] == "return"):
+            self.vm.write_label(self.TAIL_CALL_LABEL)
+        self.index = body_start
         self.compile_statements()
         self.index += 1
 
@@ -172,20 +292,11 @@ class CompilationEngine:
         "{}".
         """
         # Your code goes here!
-        lst = ["let", "do", "if", "while", "return"]
-        while self.all_tokens[self.index + 1][0] in lst:
+        rule = self.STATEMENTS.get(self.all_tokens[self.index + 1][2])
+        while rule is not None:
             self.index += 1
-            token = self.all_tokens[self.index][0]
-            if token == "let":
-                self.compile_let()
-            elif token == "do":
-                self.compile_do()
-            elif token == "if":
-                self.compile_if()
-            elif token == "return":
-                self.compile_return()
-            elif token == "while":
-                self.compile_while()
+            rule(self)
+            rule = self.STATEMENTS.get(self.all_tokens[self.index + 1][2])
 
     def compile_do(self) -> None:
         """Compiles a do statement."""
@@ -197,35 +308,46 @@ class CompilationEngine:
     def subroutine_call(self):
         self.index += 1
         identifier = self.all_tokens[self.index][0]
-        self.func_name = identifier
-        self.num_args = 0
+        func_name = identifier
+        num_args = 0
         if self.all_tokens[self.index + 1][0] == ".":
             self.index += 1
             self.index += 1
             sub_name = self.all_tokens[self.index][0]
             type_of = self.table.type_of(identifier)
             if type_of != "None":
-                self.num_args += 1
+                num_args += 1
                 var_kind = self.table.kind_of(identifier)
                 var_index = self.table.index_of(identifier)
-                self.func_name = "{}.{}".format(type_of, sub_name)
+                func_name = "{}.{}".format(type_of, sub_name)
                 self.vm.write_push(self.CONVERT_KIND[var_kind.upper()], var_index)
             else:
                 class_name = identifier
-                self.func_name = "{}.{}".format(class_name, sub_name)
+                func_name = "{}.{}".format(class_name, sub_name)
         elif self.all_tokens[self.index + 1][0] == "(":
             sub_name = self.all_tokens[self.index][0]
-            self.func_name = "{}.{}".format(self.clas_name, sub_name)
-            self.num_args += 1
+            func_name = "{}.{}".format(self.clas_name, sub_name)
+            num_args += 1
             self.vm.write_push("POINTER", 0)
         self.index += 1
-        self.compile_expression_list()
+        num_args += self.compile_expression_list()
         self.index += 1
-        self.vm.write_call(self.func_name, self.num_args)
+        self.vm.write_call(func_name, num_args)
 
     def compile_let(self) -> None:
-        """Compiles a let statement."""
+        """Compiles a let statement.
+        A store to a local that is not read again is dropped, keeping only
+        the calls its expression makes.
+        """
         # Your code goes here!
+        if self.dead_stores.get(self.index):
+            end = self._statement_end(self.index)
+            if self._makes_calls(self.index + 3, end):
+                self.index += 2
+                self.compile_expression()
+                self.vm.write_pop("TEMP", 0)
+            self.index = end
+            return
         self.index += 1
         var_name = self.all_tokens[self.index][0]
         index_of = self.table.index_of(var_name)
@@ -239,12 +361,12 @@ class CompilationEngine:
             self.index += 1
             self.vm.write_push(kind, index_of)
             self.vm.write_arithmetic("ADD")
-            self.vm.write_pop("TEMP", 0)
             self.index += 1
             self.compile_expression()
             self.index += 1
-            self.vm.write_push("TEMP", 0)
+            self.vm.write_pop("TEMP", 0)
             self.vm.write_pop("POINTER", 1)
+            self.vm.write_push("TEMP", 0)
             self.vm.write_pop("THAT", 0)
         else:
             self.index += 1
@@ -255,25 +377,53 @@ class CompilationEngine:
 
 
     def compile_while(self) -> None:
-        """Compiles a while statement."""
+        """Compiles a while statement.
+        The condition is placed after the body, so each iteration costs a
+        single conditional jump back to the top of the loop.
+        """
         # Your code goes here!
         self.while_index += 1
         while_index = self.while_index
+        condition = self.index + 1
+        body = self._matching(condition) + 1
+        value = self._constant_value(condition + 1, body - 1)
+        if value == 0:
+            self.index = self._matching(body)
+            return
+        if value is None:
+            self.vm.write_goto("WHILE_EXP{}".format(while_index))
         self.vm.write_label("WHILE{}".format(while_index))
-        self.index += 1
-        self.compile_expression()
-        self.vm.write_arithmetic("NOT")
-        self.index += 1
-        self.index += 1
-        self.vm.write_if("WHILE_END{}".format(while_index))
+        self.index = body
         self.compile_statements()
-        self.vm.write_goto("WHILE{}".format(while_index))
-        self.vm.write_label("WHILE_END{}".format(while_index))
         self.index += 1
+        if value is not None:
+            self.vm.write_goto("WHILE{}".format(while_index))
+            return
+        end = self.index
+        self.vm.write_label("WHILE_EXP{}".format(while_index))
+        self.index = condition - 1
+        self.compile_condition("WHILE{}".format(while_index), True)
+        self.index = end
 
     def compile_return(self) -> None:
-        """Compiles a return statement."""
+        """Compiles a return statement.
+        Returning a call of the subroutine being compiled reassigns its
+        arguments, clears its locals and jumps back to the function entry
+        instead of growing the stack by another frame.
+        """
         # Your code goes here!
+        arguments = self._self_tail_call(self.index)
+        if arguments is not None:
+            self.index = arguments
+            self.compile_expression_list()
+            self.index += 1
+            first = 1 if self.subroutine_kind == "method" else 0
+            for arg in reversed(range(first, self.table.var_count("ARG"))):
+                self.vm.write_pop("ARG", arg)
+            self._clear_locals(("var", "temp"))
+            self.vm.write_goto(self.TAIL_CALL_LABEL)
+            self.index += 1
+            return
         if self.all_tokens[self.index + 1][0] != ";":
             self.compile_expression()
         else:
@@ -286,39 +436,354 @@ class CompilationEngine:
         # Your code goes here!
         self.if_index += 1
         if_index = self.if_index
+        condition = self.index + 1
+        then_block = self._matching(condition) + 1
+        then_end = self._matching(then_block)
+        has_else = self.all_tokens[then_end + 1][0] == "else"
+        value = self._constant_value(condition + 1, then_block - 1)
+        if value is not None:
+            if value != 0:
+                self.index = then_block
+                self.compile_statements()
+                self.index = then_end
+                if has_else:
+                    self.index = self._matching(then_end + 2)
+            elif has_else:
+                self.index = then_end + 2
+                self.compile_statements()
+                self.index += 1
+            else:
+                self.index = then_end
+            return
+        end_label = "IF_END{}".format(if_index)
+        false_label = "IF_FALSE{}".format(if_index) if has_else else end_label
+        self.compile_condition(false_label, False)
         self.index += 1
-        self.compile_expression()
-        self.index += 1
-        self.index += 1
-        self.vm.write_if("IF_TRUE{}".format(if_index))
-        self.vm.write_goto("IF_FALSE{}".format(if_index))
-        self.vm.write_label("IF_TRUE{}".format(if_index))
         self.compile_statements()
-        self.vm.write_goto("IF_END{}".format(if_index))
         self.index += 1
-        self.vm.write_label("IF_FALSE{}".format(if_index))
-        if self.all_tokens[self.index + 1][0] == "else":
+        if has_else:
+            self.vm.write_goto(end_label)
+            self.vm.write_label(false_label)
             self.index += 1
             self.index += 1
             self.compile_statements()
             self.index += 1
-        self.vm.write_label("IF_END{}".format(if_index))
+        self.vm.write_label(end_label)
+
+    def compile_condition(self, label: str, jump_if: bool) -> None:
+        """Compiles a parenthesized condition straight into a branch to label,
+        taken when the condition is jump_if. A "~" applied to a whole boolean
+        condition flips the branch instead of emitting "not". Leaves the index on the
+        closing ")".
+
+        Args:
+            label (str): the label to branch to.
+            jump_if (bool): the truth value of the condition that branches.
+        """
+        start = self.index + 1
+        end = self._matching(start)
+        first, last = start + 1, end
+        while True:
+            if self.all_tokens[first][0] == "(" and self._matching(first) == last - 1:
+                first += 1
+                last -= 1
+            elif self.all_tokens[first][0] == "~" and self._is_term(first + 1, last) and \
+                    self._is_boolean(first + 1, last):
+                jump_if = not jump_if
+                first += 1
+            else:
+                break
+        self.index = first - 1
+        self.compile_expression()
+        if not jump_if and self._is_boolean(first, last):
+            self.vm.write_arithmetic("NOT")
+        elif not jump_if:
+            self.vm.write_push("CONST", 0)
+            self.vm.write_arithmetic("EQ")
+        self.vm.write_if(label)
+        self.index = end
+
+    def _clear_locals(self, kinds: typing.Tuple[str, ...]) -> None:
+        """Sets the locals of the given kinds to 0, as a fresh frame would
+        have them. Only those the body may read before assigning need it.
+        """
+        for name in sorted(self.entry_live, key=self.table.index_of):
+            kind = self.table.kind_of(name)
+            if kind in kinds:
+                self.vm.write_push("CONST", 0)
+                self.vm.write_pop(self.CONVERT_KIND[kind.upper()],
+                                  self.table.index_of(name))
+
+    def _hot_locals(self, first: int, last: int) -> typing.List[str]:
+        """Picks the locals of the subroutine body in [first, last) to keep
+        in temp slots. Their fixed addresses are cheaper than the local
+        segment, but only while nothing else runs, so the body must make no
+        calls, which includes "*", "/", string constants and constructors.
+        Locals used more than once are picked by use count, with uses
+        inside loops weighted by LOOP_WEIGHT per level.
+
+        Returns:
+            typing.List[str]: the names of the picked locals.
+        """
+        if self.subroutine_kind == "constructor" or self._makes_calls(first, last):
+            return []
+        uses = {}
+        loop_ends = []
+        for i in range(first, last):
+            value, kind = self.all_tokens[i][0], self.all_tokens[i][2]
+            while loop_ends and i > loop_ends[-1]:
+                loop_ends.pop()
+            if kind == "while":
+                loop_ends.append(self._matching(self._matching(i + 1) + 1))
+            elif kind == "IDENTIFIER" and self.table.kind_of(value) == "var":
+                uses[value] = uses.get(value, 0) + self.LOOP_WEIGHT ** len(loop_ends)
+        hot = sorted((name for name in uses if uses[name] > 1),
+                     key=lambda name: -uses[name])
+        return hot[:len(self.TEMP_LOCALS)]
+
+    def _makes_calls(self, first: int, last: int) -> bool:
+        """Do the tokens in [first, last) call a subroutine? "*", "/" and
+        string constants compile to calls too.
+        """
+        for i in range(first, last):
+            kind = self.all_tokens[i][2]
+            if kind in ("*", "/", "STRING_CONST") or \
+                    (kind == "(" and self.all_tokens[i - 1][1] == "IDENTIFIER"):
+                return True
+        return False
+
+    def _reads(self, first: int, last: int) -> typing.Set[str]:
+        """Returns the locals the tokens in [first, last) refer to."""
+        return {self.all_tokens[i][0] for i in range(first, last)
+                if self.all_tokens[i][2] == "IDENTIFIER" and
+                self.table.kind_of(self.all_tokens[i][0]) == "var"}
+
+    def _statement_end(self, start: int) -> int:
+        """Returns the index of the last token of the statement at start."""
+        kind = self.all_tokens[start][2]
+        if kind == "if" or kind == "while":
+            end = self._matching(self._matching(start + 1) + 1)
+            if self.all_tokens[end + 1][2] == "else":
+                end = self._matching(end + 2)
+            return end
+        while self.all_tokens[start][2] != ";":
+            start += 1
+        return start
+
+    def _live_before(self, first: int, live: typing.Set[str]) -> typing.Set[str]:
+        """Finds the locals that may still be read before they are assigned,
+        at the start of the statements from first on, given those after
+        them. Marks in dead_stores whether each "let x = ..." along the way
+        assigns a local that is not read again.
+
+        Returns:
+            typing.Set[str]: the locals live before the statements.
+        """
+        spans = []
+        while self.all_tokens[first][2] in self.STATEMENTS:
+            spans.append((first, self._statement_end(first)))
+            first = spans[-1][1] + 1
+        for start, end in reversed(spans):
+            kind = self.all_tokens[start][2]
+            target = self.all_tokens[start + 1][0]
+            if kind == "let" and self.all_tokens[start + 2][2] == "=" and \
+                    self.table.kind_of(target) == "var":
+                dead = target not in live
+                self.dead_stores[start] = dead
+                if not dead:
+                    live = live - {target}
+                if not dead or self._makes_calls(start + 3, end):
+                    live = live | self._reads(start + 3, end)
+            elif kind == "return":
+                live = self._reads(start + 1, end)
+            elif kind == "if":
+                condition_end = self._matching(start + 1)
+                then_end = self._matching(condition_end + 1)
+                live_else = live
+                if then_end != end:
+                    live_else = self._live_before(then_end + 3, live)
+                live = self._live_before(condition_end + 2, live) | live_else | \
+                    self._reads(start + 1, condition_end)
+            elif kind == "while":
+                condition_end = self._matching(start + 1)
+                live = live | self._reads(start + 1, condition_end)
+                loop_live = live | self._live_before(condition_end + 2, live)
+                while loop_live != live:
+                    live = loop_live
+                    loop_live = live | self._live_before(condition_end + 2, live)
+            else:
+                live = live | self._reads(start + 1, end)
+        return live
+
+    def _dead_locals(self, first: int, last: int) -> typing.List[str]:
+        """Runs the liveness analysis over the subroutine body in
+        [first, last), and returns the locals that are never read. Dead
+        stores without calls are dropped whole, so what they read does not
+        count. The locals live at entry are kept in entry_live.
+        """
+        self.dead_stores = {}
+        self.entry_live = self._live_before(first, set())
+        used = set()
+        i = first
+        while i < last:
+            if self.dead_stores.get(i):
+                end = self._statement_end(i)
+                if self._makes_calls(i + 3, end):
+                    used |= self._reads(i + 3, end)
+                i = end + 1
+            else:
+                used |= self._reads(i, i + 1)
+                i += 1
+        return [name for name, entry in self.table.subroutine_table.items()
+                if entry[1] == "var" and name not in used]
+
+    def _self_tail_call(self, index: int) -> typing.Optional[int]:
+        """Does the return statement at index return a call of the subroutine
+        being compiled, with one expression per parameter? Only functions
+        and methods calling themselves on this qualify.
+
+        Returns:
+            typing.Optional[int]: the index of the "(" opening the call's
+            arguments, or None.
+        """
+        name, after = self.all_tokens[index + 1][0], self.all_tokens[index + 2][0]
+        if self.subroutine_kind == "function" and after == "." and \
+                name == self.clas_name and self.table.type_of(name) == "None" and \
+                self.all_tokens[index + 3][0] == self.subroutine_name:
+            arguments = index + 4
+        elif self.subroutine_kind == "method" and after == "(" and \
+                name == self.subroutine_name:
+            arguments = index + 2
+        else:
+            return None
+        if self.all_tokens[arguments][0] != "(":
+            return None
+        end = self._matching(arguments)
+        if self.all_tokens[end + 1][0] != ";":
+            return None
+        num_args = 0 if end == arguments + 1 else 1
+        depth = 0
+        for i in range(arguments + 1, end):
+            token = self.all_tokens[i][2]
+            if token in self.BRACKETS:
+                depth += 1
+            elif token == ")" or token == "]":
+                depth -= 1
+            elif token == "," and depth == 0:
+                num_args += 1
+        first = 1 if self.subroutine_kind == "method" else 0
+        if num_args != self.table.var_count("ARG") - first:
+            return None
+        return arguments
+
+    def _location(self) -> str:
+        """Returns the "<file>:<line>" location of the current token."""
+        return "{}:{}".format(self.source_name, self.all_tokens[self.index][3])
+
+    def _matching(self, index: int) -> int:
+        """Returns the index of the bracket closing the one at index."""
+        opening = self.all_tokens[index][0]
+        closing = self.BRACKETS[opening]
+        depth = 0
+        for i in range(index, self.size):
+            if self.all_tokens[i][1] != "SYMBOL":
+                continue
+            if self.all_tokens[i][0] == opening:
+                depth += 1
+            elif self.all_tokens[i][0] == closing:
+                depth -= 1
+                if depth == 0:
+                    return i
+        return self.size - 1
+
+    def _constant_value(self, first: int, last: int) -> typing.Optional[int]:
+        """Returns the value of the tokens in [first, last) if they form a
+        constant term, or None otherwise.
+        """
+        token, token_type = self.all_tokens[first][0], self.all_tokens[first][1]
+        if last - first == 1:
+            if token_type == "INT_CONST":
+                return int(token)
+            return self.KEYWORD_CONSTANTS.get(token)
+        if token == "(" and self._matching(first) == last - 1:
+            return self._constant_value(first + 1, last - 1)
+        if token == "~" or token == "-":
+            value = self._constant_value(first + 1, last)
+            if value is None:
+                return None
+            return ~value if token == "~" else -value
+        return None
+
+    def _is_term(self, first: int, last: int) -> bool:
+        """Are the tokens in [first, last) a single token or a single
+        parenthesized expression? Only then does a "~" in front of them
+        apply to all of them.
+        """
+        return last - first == 1 or \
+            (self.all_tokens[first][0] == "(" and self._matching(first) == last - 1)
+
+    def _is_boolean(self, first: int, last: int) -> bool:
+        """Is the expression in [first, last) known to evaluate to true or
+        false? Only then can a "~" in front of it be folded into the branch.
+        """
+        if last - first == 1:
+            return self.all_tokens[first][0] in ("true", "false")
+        depth = 0
+        root = None
+        for i in range(first, last):
+            token = self.all_tokens[i][2]
+            if token in self.BRACKETS:
+                depth += 1
+            elif token == ")" or token == "]":
+                depth -= 1
+            elif depth == 0 and i > first and token in self.precedence and \
+                    self.all_tokens[i - 1][2] not in self.precedence and \
+                    (root is None or self.precedence[token] <= self.precedence[root]):
+                root = token
+        if root is not None:
+            return root in ("<", ">", "=")
+        if self.all_tokens[first][0] == "~":
+            return self._is_boolean(first + 1, last)
+        if self.all_tokens[first][0] == "(" and self._matching(first) == last - 1:
+            return self._is_boolean(first + 1, last - 1)
+        return False
 
     def compile_expression(self) -> None:
         """Compiles an expression."""
         # Your code goes here!
-        self.compile_term()
-        op_lst = ["+", "-", "*", "/", "&", "|", "<", ">", "="]
-        while self.all_tokens[self.index + 1][0] in op_lst:
-            self.index += 1
-            op = self.all_tokens[self.index][0]
-            self.compile_term()
-            if op in self.ARITHMETIC.keys():
-                self.vm.write_arithmetic(self.ARITHMETIC[op])
-            elif op == '*':
-                self.vm.write_call('Math.multiply', 2)
-            elif op == '/':
-                self.vm.write_call('Math.divide', 2)
+        self.compile_binary_expression()
+
+    def compile_binary_expression(self) -> None:
+        """Compiles a term followed by any number of binary operations.
+        Operators waiting for their right operand are kept on a stack until
+        one that binds less strongly follows (precedence climbing without
+        recursion), and terms are dispatched on directly rather than through
+        compile_term, so each level of parentheses only costs two Python
+        frames.
+        """
+        pending = []
+        self.TERMS[self.all_tokens[self.index + 1][2]](self)
+        op = self.all_tokens[self.index + 1][2]
+        while op in self.precedence:
+            while pending and self.precedence[pending[-1]] >= self.precedence[op]:
+                self.write_binary_operation(pending.pop())
+            pending.append(op)
+            self.index += 1
+            self.TERMS[self.all_tokens[self.index + 1][2]](self)
+            op = self.all_tokens[self.index + 1][2]
+        while pending:
+            self.write_binary_operation(pending.pop())
+
+    def write_binary_operation(self, op: str) -> None:
+        """Writes the code of a binary operator, whose operands are on the
+        stack.
+        """
+        if op in self.ARITHMETIC:
+            self.vm.write_arithmetic(self.ARITHMETIC[op])
+        elif op == '*':
+            self.vm.write_call('Math.multiply', 2)
+        elif op == '/':
+            self.vm.write_call('Math.divide', 2)
 
     def compile_term(self) -> None:
         """Compiles a term. 
@@ -331,75 +796,157 @@ class CompilationEngine:
         part of this term and should not be advanced over.
         """
         # Your code goes here!
+        self.TERMS[self.all_tokens[self.index + 1][2]](self)
 
-        if self.all_tokens[self.index + 1][0] == "~" or self.all_tokens[self.index + 1][0] == "-" \
-                or self.all_tokens[self.index + 1][0] == "^" or self.all_tokens[self.index + 1][0] == "#":
-            self.index += 1
-            unary_op = self.all_tokens[self.index][0]
-            self.compile_term()
-            self.vm.write_arithmetic(self.ARITHMETIC_UNARY[unary_op])
-        elif self.all_tokens[self.index + 1][0] == "(":
-            self.index += 1
-            self.compile_expression()
-            self.index += 1
-        elif self.all_tokens[self.index + 1][1] == "INT_CONST":
-            self.index += 1
-            self.vm.write_push("CONST", self.all_tokens[self.index][0])
-        elif self.all_tokens[self.index + 1][1] == "STRING_CONST":
-            self.index += 1
-            string = self.all_tokens[self.index][0]  # stringConstant
+    def compile_unary_term(self) -> None:
+        """Compiles a unary operator applied to a term."""
+        self.index += 1
+        unary_op = self.all_tokens[self.index][0]
+        self.TERMS[self.all_tokens[self.index + 1][2]](self)
+        self.vm.write_arithmetic(self.ARITHMETIC_UNARY[unary_op])
 
-            self.vm.write_push("CONST", len(string))
-            self.vm.write_call("String.new", 1)
+    def compile_parenthesized_term(self) -> None:
+        """Compiles a parenthesized expression."""
+        self.index += 1
+        self.compile_binary_expression()
+        self.index += 1
+
+    def compile_integer_term(self) -> None:
+        """Compiles an integer constant."""
+        self.index += 1
+        self.vm.write_push("CONST", self.all_tokens[self.index][0])
+
+    def compile_string_term(self) -> None:
+        """Compiles a string constant."""
+        self.index += 1
+        string = self.all_tokens[self.index][0]  # stringConstant
 
+        if self.runtime:
+            self.vm.write_push("CONST", len(string))
             for char in string:
                 self.vm.write_push('CONST', ord(char))
-                self.vm.write_call("String.appendChar", 2)
-        elif self.all_tokens[self.index + 1][1] == "KEYWORD":
-            self.index += 1
-            keyword = self.all_tokens[self.index][0]  # keywordConstant
+            self.vm.write_call("String.newFrom", len(string) + 1)
+            return
 
-            if keyword == "this":
-                self.vm.write_push("POINTER", 0)
-            else:
-                self.vm.write_push("CONST", 0)
-                if keyword == "true":
-                    self.vm.write_arithmetic("NOT")
+        self.vm.write_push("CONST", len(string))
+        self.vm.write_call("String.new", 1)
+
+        for char in string:
+            self.vm.write_push('CONST', ord(char))
+            self.vm.write_call("String.appendChar", 2)
+
+    def compile_keyword_term(self) -> None:
+        """Compiles a keyword constant."""
+        self.index += 1
+        keyword = self.all_tokens[self.index][0]  # keywordConstant
+
+        if keyword == "this":
+            self.vm.write_push("POINTER", 0)
         else:
-            if self.all_tokens[self.index + 2][0] == "[":
-                self.index += 1
-                var_name = self.all_tokens[self.index][0]
-                self.index += 1
-                self.compile_expression()
-                self.index += 1
-                if self.table.kind_of(var_name) == "argument":
-                    kind = "ARG"
-                else:
-                    kind = self.CONVERT_KIND[self.table.kind_of(var_name).upper()]
-                array_i = self.table.index_of(var_name)
-                self.vm.write_push(kind, array_i)
-                self.vm.write_arithmetic("ADD")
-                self.vm.write_pop("POINTER", 1)
-                self.vm.write_push("THAT", 0)
-            elif self.all_tokens[self.index + 2][0] == "(" or self.all_tokens[self.index + 2][0] == ".":
-                self.subroutine_call()
-            else:
-                self.index += 1
-                var = self.all_tokens[self.index][0]
-                if self.table.kind_of(var) == "argument":
-                    var_kind = "ARG"
-                else:
-                    var_kind = self.CONVERT_KIND[self.table.kind_of(var).upper()]
-                var_index = self.table.index_of(var)
-                self.vm.write_push(var_kind, var_index)
-
-    def compile_expression_list(self) -> None:
-        """Compiles a (possibly empty) comma-separated list of expressions."""
+            self.vm.write_push("CONST", 0)
+            if keyword == "true":
+                self.vm.write_arithmetic("NOT")
+
+    def compile_identifier_term(self) -> None:
+        """Compiles a variable, an array entry or a subroutine call, as
+        decided by the token following the identifier.
+        """
+        rule = self.IDENTIFIER_TERMS.get(self.all_tokens[self.index + 2][2],
+                                         CompilationEngine.compile_variable_term)
+        rule(self)
+
+    def compile_array_term(self) -> None:
+        """Compiles an array entry."""
+        self.index += 1
+        var_name = self.all_tokens[self.index][0]
+        self.index += 1
+        self.compile_expression()
+        self.index += 1
+        kind = self.CONVERT_KIND[self.table.kind_of(var_name).upper()]
+        array_i = self.table.index_of(var_name)
+        self.vm.write_push(kind, array_i)
+        self.vm.write_arithmetic("ADD")
+        self.vm.write_pop("POINTER", 1)
+        self.vm.write_push("THAT", 0)
+
+    def compile_variable_term(self) -> None:
+        """Compiles a variable."""
+        self.index += 1
+        var = self.all_tokens[self.index][0]
+        var_kind = self.CONVERT_KIND[self.table.kind_of(var).upper()]
+        var_index = self.table.index_of(var)
+        self.vm.write_push(var_kind, var_index)
+
+    def compile_expression_list(self) -> int:
+        """Compiles a (possibly empty) comma-separated list of expressions.
+
+        Returns:
+            int: the number of expressions in the list.
+        """
         # Your code goes here!
+        num_expressions = 0
         if ")" != self.all_tokens[self.index + 1][0]:
-            self.num_args += 1
+            num_expressions += 1
             self.compile_expression()
         while ')' != self.all_tokens[self.index + 1][0]:
-            self.num_args += 1
+            num_expressions += 1
             self.index += 1
             self.compile_expression()
+        return num_expressions
+
+    STATEMENTS = {
+        "let": compile_let,
+        "do": compile_do,
+        "if": compile_if,
+        "while": compile_while,
+        "return": compile_return
+    }
+
+    TERMS = {
+        "~": compile_unary_term,
+        "-": compile_unary_term,
+        "^": compile_unary_term,
+        "#": compile_unary_term,
+        "(": compile_parenthesized_term,
+        "INT_CONST": compile_integer_term,
+        "STRING_CONST": compile_string_term,
+        "true": compile_keyword_term,
+        "false": compile_keyword_term,
+        "null": compile_keyword_term,
+        "this": compile_keyword_term,
+        "IDENTIFIER": compile_identifier_term
+    }
+
+    IDENTIFIER_TERMS = {
+        "[": compile_array_term,
+        "(": subroutine_call,
+        ".": subroutine_call
+    }
+
+
+def compile_subroutine_unit(unit: tuple) -> typing.Tuple[str, str]:
+    """Compiles a single subroutine, as a work unit of
+    CompilationEngine.compile_subroutines_in_parallel.
+
+    Args:
+        unit (tuple): the tokens of the subroutine followed by one more,
+        the class name, the class's symbol table, the source file name, the
+        precedence table, the runtime option and whether to map the source.
+
+    Returns:
+        typing.Tuple[str, str]: the VM code and its source map, whose lines
+        are counted from the first line of the code.
+    """
+    tokens, class_name, table, source_name, precedence, runtime, mapped = unit
+    output = io.StringIO()
+    source_map = io.StringIO() if mapped else None
+    engine = CompilationEngine(io.StringIO(), output, runtime=runtime,
+                               source_map=source_map)
+    engine.all_tokens = tokens
+    engine.size = len(tokens)
+    engine.table = table
+    engine.clas_name = class_name
+    engine.source_name = source_name
+    engine.precedence = precedence
+    engine.compile_subroutine()
+    return output.getvalue(), source_map.getvalue() if mapped else ""
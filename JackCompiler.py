@@ -5,50 +5,233 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import concurrent.futures
+import contextlib
+import io
 import os
-import sys
 import typing
 from CompilationEngine import CompilationEngine
 from JackTokenizer import JackTokenizer
 from SymbolTable import SymbolTable
+from VMBinary import VMBinary
 from VMWriter import VMWriter
 
 
+# Precompiled OS classes shipped with the compiler, built from the .jack
+# sources next to them.
+RUNTIME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "runtime")
+
+
+def runtime_classes(directory: str) -> typing.List[str]:
+    """Lists the precompiled runtime classes a program needs. A class with a
+    .jack, .vm or .vmb file in the program's directory is the program's own
+    and takes precedence over the runtime's, unless that file is exactly
+    what copying the runtime class would write, left by an earlier compile.
+
+    Args:
+        directory (str): the directory of the program, where its output goes.
+
+    Returns:
+        typing.List[str]: paths of the runtime .vm files, sorted.
+    """
+    defined = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            class_name, extension = os.path.splitext(entry.name)
+            if extension.lower() in (".jack", ".vm", ".vmb") and \
+                    not is_runtime_output(entry.path):
+                defined.add(class_name)
+    with os.scandir(RUNTIME_PATH) as entries:
+        return sorted(
+            entry.path for entry in entries
+            if entry.name.endswith(".vm") and entry.name[:-3] not in defined)
+
+
+def is_runtime_output(path: str) -> bool:
+    """Is the .vm or .vmb file at path a runtime class as copied into the
+    output?
+    """
+    class_name, extension = os.path.splitext(os.path.basename(path))
+    vm_path = os.path.join(RUNTIME_PATH, class_name + ".vm")
+    if extension not in (".vm", ".vmb") or not os.path.isfile(vm_path):
+        return False
+    with open(vm_path) as vm_file:
+        code = vm_file.read()
+    if extension == ".vmb":
+        with open(path, 'rb') as output_file:
+            return output_file.read() == VMBinary.from_text(code).to_bytes()
+    with open(path) as output_file:
+        return output_file.read() == code
+
+
+@contextlib.contextmanager
+def open_output(output_path: str, binary: bool = False,
+                exclusive: bool = False) -> typing.Iterator[typing.TextIO]:
+    """Opens a .vm output file for writing.
+
+    Args:
+        output_path (str): the path of the .vm file.
+        binary (bool): if True, the VM text written is collected instead,
+        and saved in the binary format of VMBinary to a .vmb file when the
+        output is closed.
+        exclusive (bool): if True, raises FileExistsError instead of
+        overwriting an existing file.
+    """
+    if not binary:
+        with open(output_path, 'x' if exclusive else 'w') as output_file:
+            yield output_file
+        return
+    output_file = io.StringIO()
+    yield output_file
+    with open(output_path + "b", 'xb' if exclusive else 'wb') as binary_file:
+        binary_file.write(
+            VMBinary.from_text(output_file.getvalue()).to_bytes())
+
+
 def compile_file(
-        input_file: typing.TextIO, output_file: typing.TextIO) -> None:
+        input_file: typing.IO, output_file: typing.TextIO,
+        **options) -> None:
     """Compiles a single file.
 
     Args:
-        input_file (typing.TextIO): the file to compile.
+        input_file (typing.IO): the file to compile. It must be opened in
+        binary mode when the memory_map option is set.
         output_file (typing.TextIO): writes all output to this file.
+        **options: keyword arguments passed on to CompilationEngine.
     """
     # Your code goes here!
     # This function should be relatively similar to "analyze_file" in
     # JackAnalyzer.py from the previous project.
-    engine = CompilationEngine(input_file, output_file)
+    engine = CompilationEngine(input_file, output_file, **options)
     engine.compile_class()
 
 
+def compile_bundle(
+        input_paths: typing.List[str], output_file: typing.TextIO,
+        vm_paths: typing.Sequence[str] = (), **options) -> None:
+    """Compiles several files into a single VM bundle. Every class is
+    preceded by a "// class <name>" comment line, and the whole bundle is
+    written to output_file at once.
+
+    Args:
+        input_paths (typing.List[str]): paths of the files to compile.
+        output_file (typing.TextIO): writes the bundle to this file.
+        vm_paths (typing.Sequence[str]): paths of precompiled .vm files to
+        append to the bundle as they are.
+        **options: keyword arguments passed on to CompilationEngine.
+    """
+    bundle = io.StringIO()
+    line = 1
+    for input_path in input_paths:
+        class_name = os.path.splitext(os.path.basename(input_path))[0]
+        bundle.write("// class {}\n".format(class_name))
+        line += 1
+        mode = 'rb' if options.get("memory_map") else 'r'
+        class_output = io.StringIO()
+        with open(input_path, mode) as input_file:
+            compile_file(input_file, class_output, first_line=line, **options)
+        code = class_output.getvalue()
+        line += code.count("\n")
+        bundle.write(code)
+    source_map = options.get("source_map")
+    if source_map is not None and vm_paths:
+        # Precompiled classes have no Jack source to map to.
+        source_map.write("{} -\n".format(line))
+    for vm_path in vm_paths:
+        class_name = os.path.splitext(os.path.basename(vm_path))[0]
+        bundle.write("// class {}\n".format(class_name))
+        with open(vm_path) as vm_file:
+            bundle.write(vm_file.read())
+    output_file.write(bundle.getvalue())
+
+
 if "__main__" == __name__:
     # Parses the input path and calls compile_file on each input file.
     # This opens both the input and the output files!
     # Both are closed automatically when the code finishes running.
     # If the output file does not exist, it is created automatically in the
     # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: JackCompiler <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    parser = argparse.ArgumentParser(prog="JackCompiler")
+    parser.add_argument("input_path")
+    parser.add_argument(
+        "--mmap", action="store_true",
+        help="memory-map the input files instead of reading them into memory")
+    parser.add_argument(
+        "--bundle", action="store_true",
+        help="write all classes of a directory into a single .vm file, "
+             "named after the directory and placed next to it")
+    parser.add_argument(
+        "--precedence", action="store_true",
+        help="parse binary operators by precedence instead of left to right")
+    parser.add_argument(
+        "--runtime", action="store_true",
+        help="add the optimized OS classes shipped with the compiler to the "
+             "output, and build string constants with their String class "
+             "when the program does not define its own")
+    parser.add_argument(
+        "--source-map", action="store_true",
+        help="write a <output>.vm.map (or .vmb.map) file mapping each VM line "
+             "back to the Jack line it was compiled from")
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="compile the subroutines of each class in this many processes")
+    parser.add_argument(
+        "--binary", action="store_true",
+        help="write .vmb files in the compact binary format instead of .vm")
+    args = parser.parse_args()
+    options = {"memory_map": args.mmap, "precedence": args.precedence,
+               "jobs": args.jobs}
+    if args.jobs > 1:
+        # Started once for all the classes rather than once per class.
+        options["pool"] = concurrent.futures.ProcessPoolExecutor(args.jobs)
+    # Source maps are named after the file actually written.
+    map_suffix = "b.map" if args.binary else ".map"
+    argument_path = os.path.abspath(args.input_path)
     if os.path.isdir(argument_path):
-        files_to_assemble = [
-            os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
-    else:
+        with os.scandir(argument_path) as entries:
+            files_to_assemble = sorted(
+                entry.path for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(".jack"))
+    elif argument_path.lower().endswith(".jack"):
         files_to_assemble = [argument_path]
-    for input_path in files_to_assemble:
-        filename, extension = os.path.splitext(input_path)
-        if extension.lower() != ".jack":
+    else:
+        files_to_assemble = []
+    vm_paths = []
+    if args.runtime and files_to_assemble:
+        vm_paths = runtime_classes(os.path.dirname(files_to_assemble[0]))
+    # String.newFrom only exists in the runtime's String, not in one the
+    # program defines itself.
+    options["runtime"] = os.path.join(RUNTIME_PATH, "String.vm") in vm_paths
+    if args.bundle and os.path.isdir(argument_path):
+        # Written next to the directory rather than inside it, where it
+        # could overwrite the output of a class named like the directory.
+        output_path = argument_path + ".vm"
+        with open_output(output_path, args.binary) as output_file, \
+                open(output_path + map_suffix, 'w') if args.source_map \
+                else contextlib.nullcontext() as source_map:
+            compile_bundle(files_to_assemble, output_file, vm_paths,
+                           source_map=source_map, **options)
+        files_to_assemble = []
+        vm_paths = []
+    output_directory = argument_path if os.path.isdir(argument_path) \
+        else os.path.dirname(argument_path)
+    for vm_path in vm_paths:
+        output_path = os.path.join(output_directory, os.path.basename(vm_path))
+        if os.path.exists(output_path + ("b" if args.binary else "")):
+            # Written by an earlier compile, as runtime_classes checked.
             continue
-        output_path = filename + ".vm"
-        with open(input_path, 'r+') as input_file, \
-                open(output_path, 'w') as output_file:
-            compile_file(input_file, output_file)
+        with open(vm_path) as vm_file, open_output(
+                output_path, args.binary, exclusive=True) as output_file:
+            output_file.write(vm_file.read())
+    for input_path in files_to_assemble:
+        output_path = os.path.splitext(input_path)[0] + ".vm"
+        with open(input_path, 'rb' if args.mmap else 'r+') as input_file, \
+                open_output(output_path, args.binary) as output_file, \
+                open(output_path + map_suffix, 'w') if args.source_map \
+                else contextlib.nullcontext() as source_map:
+            compile_file(input_file, output_file, source_map=source_map,
+                         **options)
+    if args.jobs > 1:
+        options["pool"].shutdown()
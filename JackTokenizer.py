@@ -5,16 +5,23 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import mmap
 import typing
 import re
 
-# KEY_WORD_PATTERN = re.compile( "^\s*("
-#                               "class|constructor|function|method|static|field"
-#                               "|int|char|boolean|void|true|false|null|this"
-#                               "|if|else|while|return)\s*|^\s*(let|do|var)\s+")
-KEY_WORD_PATTERN = re.compile('^\s*(class|constructor|function|method|field|static|var|int|'
-                              'char|boolean|void|true|false|null|this|let|do|if|else|while|return)'
-                              '(?=[^\w])')
+TOKEN_SOURCE = (r'(?P<KEYWORD>(?:class|constructor|function|method|field|static|var|int|'
+                r'char|boolean|void|true|false|null|this|let|do|if|else|while|return)'
+                r'(?![a-zA-Z0-9_]))'
+                r'|(?P<SYMBOL>[{}()\[\].,;+\-*/&|<>=~^#])'
+                r'|(?P<INT_CONST>\d+)'
+                r'|"(?P<STRING_CONST>[^"\n]*)"'
+                r'|(?P<IDENTIFIER>[a-zA-Z_][a-zA-Z0-9_]*)')
+TOKEN_PATTERN = re.compile(TOKEN_SOURCE)
+TOKEN_PATTERN_BYTES = re.compile(TOKEN_SOURCE.encode())
+# ASCII whitespace only, so that both input modes agree on what separates
+# tokens.
+WHITESPACE_PATTERN = re.compile(r'\s*', re.ASCII)
+WHITESPACE_PATTERN_BYTES = re.compile(rb'\s*')
 
 
 class JackTokenizer:
@@ -99,20 +106,45 @@ class JackTokenizer:
     Note that ^, # correspond to shiftleft and shiftright, respectively.
     """
 
-    def __init__(self, input_stream: typing.TextIO) -> None:
+    def __init__(self, input_stream: typing.IO,
+                 memory_map: bool = False) -> None:
         """Opens the input stream and gets ready to tokenize it.
 
         Args:
-            input_stream (typing.TextIO): input stream.
+            input_stream (typing.IO): input stream.
+            memory_map (bool): if True, the file behind input_stream is
+            memory-mapped and tokenized as bytes, so the source is never
+            decoded or copied as a whole.
         """
         # Your code goes here!
         # A good place to start is to read all the lines of the input:
         # input_lines = input_stream.read().splitlines()
-        self.tox = input_stream.read()
-        self.tox = re.sub(r"(//.*)|(/\*([^*]|[\r\n]|(\*+([^*/]|[\r\n])))*\*+/)", "", self.tox)
+        self.memory_map = memory_map
+        if memory_map:
+            try:
+                self.tox = mmap.mmap(input_stream.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                self.tox = b""
+            self.token_pattern = TOKEN_PATTERN_BYTES
+            self.whitespace_pattern = WHITESPACE_PATTERN_BYTES
+            self.newline, self.line_comment = b"\n", b"//"
+            self.comment_start, self.comment_end = b"/*", b"*/"
+        else:
+            self.tox = input_stream.read()
+            self.token_pattern = TOKEN_PATTERN
+            self.whitespace_pattern = WHITESPACE_PATTERN
+            self.newline, self.line_comment = "\n", "//"
+            self.comment_start, self.comment_end = "/*", "*/"
+        self.position = 0
+        self.current_position = 0
         self.current_type = ""
         self.current_value = ""
         self.index = -1
+        self.counted_position = 0
+        self.counted_line = 1
+        self.line_start = 0
 
     def has_more_tokens(self) -> bool:
         """Do we have more tokens in the input?
@@ -120,47 +152,75 @@ class JackTokenizer:
         Returns:
             bool: True if there are more tokens, False otherwise.
         """
-        if re.fullmatch(r"\s*", self.tox):
-            return False
-        return True
+        self.skip_ignored()
+        return self.position < len(self.tox)
+
+    def skip_ignored(self) -> None:
+        """Moves past the whitespace and comments at the current position.
+        Comments are only looked for between tokens, so "//" or "/*" inside
+        a string constant are left alone. Every character is looked at a
+        bounded number of times, and a comment that is never closed runs to
+        the end of the input.
+        """
+        while True:
+            self.position = self.whitespace_pattern.match(self.tox, self.position).end()
+            opening = self.tox[self.position:self.position + 2]
+            if opening == self.line_comment:
+                end = self.tox.find(self.newline, self.position + 2)
+            elif opening == self.comment_start:
+                end = self.tox.find(self.comment_end, self.position + 2)
+                if end != -1:
+                    end += 2
+            else:
+                return
+            self.position = len(self.tox) if end == -1 else end
 
     def advance(self) -> None:
         """Gets the next token from the input and makes it the current token. 
         This method should be called if has_more_tokens() is true. 
         Initially there is no current token.
+
+        Raises:
+            ValueError: if the input at the current position is not a token.
         """
         if self.has_more_tokens():
-            current_match = re.match(KEY_WORD_PATTERN, self.tox)
-            if current_match is not None:
-                self.tox = re.sub(KEY_WORD_PATTERN, "", self.tox)
-                self.current_type = "KEYWORD"
-                self.current_value = current_match.group(1)
-            else:
-                current_match = re.match(r"^\s*([{}()\[\].,;+\-*/&|<>=~^#])\s*", self.tox)
-                if current_match is not None:
-                    self.tox = re.sub(r"^\s*([{}()\[\].,;+\-*/&|<>=~^#])\s*", "", self.tox)
-                    self.current_type = "SYMBOL"
-                    self.current_value = current_match.group(1)
-                else:
-                    current_match = re.match(r"^\s*(\d+)\s*", self.tox)
-                    if current_match is not None:
-                        self.tox = re.sub(r"^\s*(\d+)\s*", "", self.tox)
-                        self.current_type = "INT_CONST"
-                        self.current_value = current_match.group(1)
-                    else:
-                        current_match = re.match(r"^\s*\"(.*)\"\s*", self.tox)
-                        if current_match is not None:
-                            self.tox = re.sub(r"^\s*\"(.*)\"\s*", "", self.tox)
-                            self.current_type = "STRING_CONST"
-                            self.current_value = current_match.group(1)
-                        else:
-                            current_match = re.match(r"^\s*([a-zA-Z_][a-zA-Z1-9_]*)\s*", self.tox)
-                            if current_match is not None:
-                                self.tox = re.sub(r"^\s*([a-zA-Z_][a-zA-Z1-9_]*)\s*", "", self.tox)
-                                self.current_type = "IDENTIFIER"
-                                self.current_value = current_match.group(1)
+            current_match = self.token_pattern.match(self.tox, self.position)
+            self.current_position = self.position
+            if current_match is None:
+                raise ValueError("unexpected character {!r} at line {}, column {}".format(
+                    self.tox[self.position:self.position + 1], self.line(), self.column()))
+            self.position = current_match.end()
+            self.current_type = current_match.lastgroup
+            self.current_value = current_match.group(self.current_type)
+            if self.memory_map:
+                self.current_value = self.current_value.decode()
             self.index += 1
 
+    def line(self) -> int:
+        """
+        Returns:
+            int: the line of the current token, counting from 1. Lines are
+            counted lazily, from the last token asked about, so tokenizing
+            costs nothing extra unless positions are needed.
+        """
+        newline = self.tox.find(self.newline, self.counted_position,
+                                self.current_position)
+        while newline != -1:
+            self.counted_line += 1
+            self.line_start = newline + 1
+            newline = self.tox.find(self.newline, self.line_start,
+                                    self.current_position)
+        self.counted_position = self.current_position
+        return self.counted_line
+
+    def column(self) -> int:
+        """
+        Returns:
+            int: the column of the current token, counting from 1.
+        """
+        self.line()
+        return self.current_position - self.line_start + 1
+
     def token_type(self) -> str:
         """
         Returns:
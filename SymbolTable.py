@@ -23,6 +23,7 @@ class SymbolTable:
         self.field_counter = 0
         self.arg_counter = 0
         self.var_counter = 0
+        self.temp_counter = 0
 
     def start_subroutine(self) -> None:
         """Starts a new subroutine scope (i.e., resets the subroutine's 
@@ -32,6 +33,7 @@ class SymbolTable:
         self.subroutine_table = {}
         self.arg_counter = 0
         self.var_counter = 0
+        self.temp_counter = 0
 
     def define(self, name: str, type: str, kind: str) -> None:
         """Defines a new identifier of a given name, type and kind and assigns 
@@ -60,10 +62,46 @@ class SymbolTable:
                 self.subroutine_table[name] = (type, "argument", self.arg_counter)
                 self.arg_counter += 1
 
+    def promote(self, names: typing.Sequence[str], first: int) -> None:
+        """Moves the given "VAR" identifiers of the current subroutine to
+        consecutive "TEMP" indices, starting at first, and renumbers the
+        remaining "VAR" identifiers from 0.
+
+        Args:
+            names (typing.Sequence[str]): the identifiers to move.
+            first (int): the index of the first one.
+        """
+        for name in names:
+            type_of = self.subroutine_table[name][0]
+            self.subroutine_table[name] = (type_of, "temp", first + self.temp_counter)
+            self.temp_counter += 1
+        self.renumber_vars()
+
+    def remove(self, names: typing.Sequence[str]) -> None:
+        """Removes the given "VAR" identifiers of the current subroutine, and
+        renumbers the remaining ones from 0.
+
+        Args:
+            names (typing.Sequence[str]): the identifiers to remove.
+        """
+        for name in names:
+            del self.subroutine_table[name]
+        self.renumber_vars()
+
+    def renumber_vars(self) -> None:
+        """Renumbers the "VAR" identifiers of the current subroutine from 0,
+        keeping their order.
+        """
+        remaining = sorted((entry[2], name) for name, entry in self.subroutine_table.items()
+                           if entry[1] == "var")
+        for index, (_, name) in enumerate(remaining):
+            self.subroutine_table[name] = (self.subroutine_table[name][0], "var", index)
+        self.var_counter = len(remaining)
+
     def var_count(self, kind: str) -> int:
         """
         Args:
-            kind (str): can be "STATIC", "FIELD", "ARG", "VAR".
+            kind (str): can be "STATIC", "FIELD", "ARG", "VAR", "TEMP".
 
         Returns:
             int: the number of variables of the given kind already defined in 
@@ -78,6 +116,8 @@ class SymbolTable:
             return self.field_counter
         if kind == "STATIC":
             return self.static_counter
+        if kind == "TEMP":
+            return self.temp_counter
 
     def kind_of(self, name: str) -> str:
         """
@@ -0,0 +1,193 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import struct
+
+# Magic, byte size of the string table, number of commands.
+HEADER = struct.Struct("<4sII")
+# Opcode, segment, operand, count.
+RECORD = struct.Struct("<BBHH")
+MAGIC = b"VMB1"
+# The largest value a 16-bit operand, such as a string table index, holds.
+MAX_OPERAND = 0xFFFF
+
+OPCODES = ("push", "pop", "add", "sub", "neg", "eq", "gt", "lt", "and", "or",
+           "not", "shiftleft", "shiftright", "label", "goto", "if-goto",
+           "function", "call", "return", "//")
+SEGMENTS = ("constant", "argument", "local", "static", "this", "that",
+            "pointer", "temp")
+
+OPCODE_CODES = {opcode: code for code, opcode in enumerate(OPCODES)}
+SEGMENT_CODES = {segment: code for code, segment in enumerate(SEGMENTS)}
+MEMORY_OPCODES = (OPCODE_CODES["push"], OPCODE_CODES["pop"])
+NAMED_OPCODES = (OPCODE_CODES["label"], OPCODE_CODES["goto"],
+                 OPCODE_CODES["if-goto"], OPCODE_CODES["//"])
+COUNTED_OPCODES = (OPCODE_CODES["function"], OPCODE_CODES["call"])
+
+
+class VMBinary:
+    """A VM program in the compact binary format, which is laid out as:
+
+    - a header: the magic b"VMB1", then the byte size of the string table
+      and the number of commands, as little-endian 32-bit integers.
+    - the string table: the function names, labels and comments, encoded
+      as UTF-8 and separated by newlines.
+    - the commands, as fixed-width records of an 8-bit opcode, an 8-bit
+      segment and two 16-bit operands, all little-endian. push and pop use
+      the segment and the first operand as the index. label, goto, if-goto
+      and comment lines use the first operand as a string table index.
+      function and call add the number of locals or arguments as the
+      second operand. Unused fields are 0.
+
+    Loading a program is thus a single read and a single struct decode.
+    Whole-line comments, such as the class headers of bundles, are kept,
+    so text produced by the compiler survives a round trip unchanged, and
+    the n-th record is line n of the text that source maps refer to.
+    """
+
+    def __init__(self) -> None:
+        """Creates an empty program."""
+        self.strings = []
+        self.string_codes = {}
+        self.records = []
+
+    def string_code(self, string: str) -> int:
+        """
+        Args:
+            string (str): a function name, label or comment.
+
+        Returns:
+            int: the index of string in the string table, adding it if
+            needed.
+
+        Raises:
+            ValueError: if the string table is full.
+        """
+        code = self.string_codes.get(string)
+        if code is None:
+            if len(self.strings) > MAX_OPERAND:
+                raise ValueError(
+                    "more than {} distinct names, labels and comments do not "
+                    "fit the string table".format(MAX_OPERAND + 1))
+            code = self.string_codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+    def add(self, command: str) -> None:
+        """Appends a command given as a line of VM text.
+
+        Args:
+            command (str): the command, without its newline. Comments after
+            a command are dropped.
+        """
+        if command.startswith("//"):
+            self.records.append((OPCODE_CODES["//"], 0,
+                                 self.string_code(command[2:]), 0))
+            return
+        words = command.split("//", 1)[0].split()
+        if not words:
+            return
+        opcode = OPCODE_CODES[words[0]]
+        if opcode in MEMORY_OPCODES:
+            self.records.append(
+                (opcode, SEGMENT_CODES[words[1]], int(words[2]), 0))
+        elif opcode in NAMED_OPCODES:
+            self.records.append((opcode, 0, self.string_code(words[1]), 0))
+        elif opcode in COUNTED_OPCODES:
+            self.records.append(
+                (opcode, 0, self.string_code(words[1]), int(words[2])))
+        else:
+            self.records.append((opcode, 0, 0, 0))
+
+    @classmethod
+    def from_text(cls, text: str) -> "VMBinary":
+        """
+        Args:
+            text (str): a VM program, one command per line.
+
+        Returns:
+            VMBinary: the same program.
+        """
+        program = cls()
+        for line in text.splitlines():
+            program.add(line.strip())
+        return program
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "VMBinary":
+        """
+        Args:
+            data (bytes): a program in the binary format.
+
+        Returns:
+            VMBinary: the program.
+        """
+        magic, string_size, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a binary VM program")
+        view = memoryview(data)
+        start = HEADER.size + string_size
+        program = cls()
+        program.strings = str(view[HEADER.size:start], "utf-8").split("\n")
+        program.string_codes = {
+            string: code for code, string in enumerate(program.strings)}
+        program.records = list(RECORD.iter_unpack(
+            view[start:start + count * RECORD.size]))
+        return program
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns:
+            bytes: the program in the binary format.
+        """
+        strings = "\n".join(self.strings).encode()
+        return b"".join(
+            [HEADER.pack(MAGIC, len(strings), len(self.records)), strings] +
+            [RECORD.pack(*record) for record in self.records])
+
+    def to_text(self) -> str:
+        """
+        Returns:
+            str: the program as VM text, one command per line.
+        """
+        lines = []
+        for opcode, segment, operand, count in self.records:
+            if opcode in MEMORY_OPCODES:
+                lines.append("{} {} {}\n".format(
+                    OPCODES[opcode], SEGMENTS[segment], operand))
+            elif opcode == OPCODE_CODES["//"]:
+                lines.append("//{}\n".format(self.strings[operand]))
+            elif opcode in NAMED_OPCODES:
+                lines.append("{} {}\n".format(
+                    OPCODES[opcode], self.strings[operand]))
+            elif opcode in COUNTED_OPCODES:
+                lines.append("{} {} {}\n".format(
+                    OPCODES[opcode], self.strings[operand], count))
+            else:
+                lines.append(OPCODES[opcode] + "\n")
+        return "".join(lines)
+
+
+if "__main__" == __name__:
+    # Converts a .vm file to the binary format, or a .vmb file back to text,
+    # writing the result next to the input.
+    parser = argparse.ArgumentParser(prog="VMBinary")
+    parser.add_argument("input_path")
+    args = parser.parse_args()
+    root, extension = os.path.splitext(os.path.abspath(args.input_path))
+    if extension == ".vmb":
+        with open(args.input_path, 'rb') as input_file:
+            program = VMBinary.from_bytes(input_file.read())
+        with open(root + ".vm", 'w') as output_file:
+            output_file.write(program.to_text())
+    else:
+        with open(args.input_path) as input_file:
+            program = VMBinary.from_text(input_file.read())
+        with open(root + ".vmb", 'wb') as output_file:
+            output_file.write(program.to_bytes())
@@ -0,0 +1,185 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+
+# Base addresses of the memory segments, as laid out by the standard VM
+# translator.
+SEGMENT_POINTERS = {"local": 1, "argument": 2, "this": 3, "that": 4}
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+RAM_SIZE = 32768
+
+
+def word(value: int) -> int:
+    """Wraps value around to a signed 16-bit word."""
+    return (value + 0x8000 & 0xFFFF) - 0x8000
+
+
+class VMEmulator:
+    """
+    Runs VM code, such as the output of the compiler, on the memory layout
+    of the standard VM translator. Used by the tests to check what compiled
+    code and the runtime classes do, not only what they look like.
+
+    Functions that no loaded code defines are looked up in builtins, which
+    by default only holds a Sys.error that raises RuntimeError.
+    """
+
+    def __init__(self, code: str,
+                 builtins: typing.Optional[typing.Dict[
+                     str, typing.Callable[..., int]]] = None) -> None:
+        """Loads VM code.
+
+        Args:
+            code (str): the VM code of one or more classes.
+            builtins (typing.Optional[typing.Dict[str, typing.Callable]]):
+            Python functions standing in for VM functions, by name. They get
+            the call's arguments and return its value.
+        """
+        self.builtins = {"Sys.error": self.error}
+        self.builtins.update(builtins or {})
+        self.commands = []
+        self.functions = {}
+        self.steps = 0
+        self.ram = [0] * RAM_SIZE
+        self.ram[0] = STACK_BASE
+        statics = {}
+        labels = {}
+        function = ""
+        for line in code.splitlines():
+            parts = line.split("//", 1)[0].split()
+            if not parts:
+                continue
+            if parts[0] == "function":
+                function = parts[1]
+                self.functions[function] = len(self.commands)
+            elif parts[0] == "label":
+                labels[function, parts[1]] = len(self.commands)
+                continue
+            elif parts[0] in ("goto", "if-goto"):
+                parts[1] = (function, parts[1])
+            elif parts[0] in ("push", "pop") and parts[1] == "static":
+                key = (function.split(".")[0], int(parts[2]))
+                parts = [parts[0], "static", statics.setdefault(
+                    key, STATIC_BASE + len(statics))]
+            if len(parts) == 3:
+                parts[2] = int(parts[2])
+            self.commands.append(parts)
+        for command in self.commands:
+            if command[0] in ("goto", "if-goto"):
+                command[1] = labels[command[1]]
+
+    @staticmethod
+    def error(code: int) -> int:
+        raise RuntimeError("Sys.error({})".format(code))
+
+    def address(self, segment: str, index: int) -> int:
+        """Returns the RAM address of entry index of a memory segment."""
+        if segment in SEGMENT_POINTERS:
+            return self.ram[SEGMENT_POINTERS[segment]] + index
+        if segment == "temp":
+            return TEMP_BASE + index
+        if segment == "pointer":
+            return 3 + index
+        return index
+
+    def call(self, name: str, *arguments: int) -> int:
+        """Calls a VM function and runs it until it returns.
+
+        Args:
+            name (str): the name of the function.
+            *arguments (int): the arguments to call it with.
+
+        Returns:
+            int: the value the function returned.
+        """
+        ram = self.ram
+        for argument in arguments:
+            ram[ram[0]] = word(argument)
+            ram[0] += 1
+        self.invoke(name, len(arguments), -1)
+        while self.pc >= 0:
+            self.step()
+        ram[0] -= 1
+        return ram[ram[0]]
+
+    def invoke(self, name: str, n_args: int, return_address: int) -> None:
+        """Performs a call command, returning to return_address."""
+        ram = self.ram
+        if name not in self.functions:
+            ram[0] -= n_args
+            value = self.builtins[name](*ram[ram[0]:ram[0] + n_args])
+            ram[ram[0]] = word(value or 0)
+            ram[0] += 1
+            self.pc = return_address
+            return
+        sp = ram[0]
+        ram[sp:sp + 5] = [return_address] + ram[1:5]
+        ram[2] = sp - n_args
+        ram[1] = ram[0] = sp + 5
+        self.pc = self.functions[name]
+
+    def step(self) -> None:
+        """Runs the command at pc."""
+        ram = self.ram
+        command = self.commands[self.pc]
+        self.pc += 1
+        self.steps += 1
+        op = command[0]
+        sp = ram[0]
+        if op == "push":
+            segment, index = command[1], command[2]
+            ram[sp] = index if segment == "constant" else \
+                ram[self.address(segment, index)]
+            ram[0] = sp + 1
+        elif op == "pop":
+            ram[0] = sp - 1
+            ram[self.address(command[1], command[2])] = ram[sp - 1]
+        elif op == "goto":
+            self.pc = command[1]
+        elif op == "if-goto":
+            ram[0] = sp - 1
+            if ram[sp - 1]:
+                self.pc = command[1]
+        elif op == "call":
+            self.invoke(command[1], command[2], self.pc)
+        elif op == "function":
+            ram[sp:sp + command[2]] = [0] * command[2]
+            ram[0] = sp + command[2]
+        elif op == "return":
+            frame = ram[1]
+            self.pc = ram[frame - 5]
+            ram[ram[2]] = ram[sp - 1]
+            ram[0] = ram[2] + 1
+            ram[1:5] = ram[frame - 4:frame]
+        elif op == "neg":
+            ram[sp - 1] = word(-ram[sp - 1])
+        elif op == "not":
+            ram[sp - 1] = ~ram[sp - 1]
+        elif op == "shiftleft":
+            ram[sp - 1] = word(ram[sp - 1] << 1)
+        elif op == "shiftright":
+            ram[sp - 1] >>= 1
+        else:
+            x, y = ram[sp - 2], ram[sp - 1]
+            ram[0] = sp - 1
+            if op == "add":
+                ram[sp - 2] = word(x + y)
+            elif op == "sub":
+                ram[sp - 2] = word(x - y)
+            elif op == "eq":
+                ram[sp - 2] = -(x == y)
+            elif op == "gt":
+                ram[sp - 2] = -(x > y)
+            elif op == "lt":
+                ram[sp - 2] = -(x < y)
+            elif op == "and":
+                ram[sp - 2] = x & y
+            else:
+                ram[sp - 2] = x | y
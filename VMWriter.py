@@ -13,12 +13,65 @@ class VMWriter:
     Writes VM commands into a file. Encapsulates the VM command syntax.
     """
 
-    def __init__(self, output_stream: typing.TextIO) -> None:
-        """Creates a new file and prepares it for writing VM commands."""
+    def __init__(self, output_stream: typing.TextIO,
+                 source_map: typing.Optional[typing.TextIO] = None,
+                 locate: typing.Optional[typing.Callable[[], str]] = None,
+                 first_line: int = 1) -> None:
+        """Creates a new file and prepares it for writing VM commands.
+
+        Args:
+            output_stream (typing.TextIO): writes the VM commands here.
+            source_map (typing.Optional[typing.TextIO]): if given, writes a
+            line "<vm line> <file>:<line>" here whenever the source location
+            of the written commands changes. Each command maps to the last
+            such line at or before it.
+            locate (typing.Optional[typing.Callable[[], str]]): returns the
+            "<file>:<line>" source location of the command being written.
+            Required with source_map.
+            first_line (int): the line of output_stream the first command
+            lands on.
+        """
         # Your code goes here!
         # Note that you can write to output_stream like so:
         # output_stream.write("Hello world! \n")
         self.vm_out = output_stream
+        self.source_map = source_map
+        self.locate = locate
+        self.line = first_line
+        self.location = ""
+        if source_map is None:
+            self.write = output_stream.write
+        else:
+            self.write = self.write_mapped
+
+    def write_mapped(self, command: str) -> None:
+        """Writes a VM command and maps its line to its source location.
+
+        Args:
+            command (str): the command to write, including its newline.
+        """
+        location = self.locate()
+        if location != self.location:
+            self.location = location
+            self.source_map.write("{} {}\n".format(self.line, location))
+        self.line += 1
+        self.vm_out.write(command)
+
+    def write_code(self, code: str, code_map: str = "") -> None:
+        """Writes VM code compiled by another VMWriter.
+
+        Args:
+            code (str): the VM commands, one per line.
+            code_map (str): the source map of code, whose lines are counted
+            from the first line of code.
+        """
+        if self.source_map is not None:
+            for entry in code_map.splitlines():
+                line, self.location = entry.split(" ", 1)
+                self.source_map.write("{} {}\n".format(
+                    int(line) + self.line - 1, self.location))
+            self.line += code.count("\n")
+        self.vm_out.write(code)
 
     def write_push(self, segment: str, index: int) -> None:
         """Writes a VM push command.
@@ -33,7 +86,7 @@ class VMWriter:
             segment = "constant"
         if segment == "ARG":
             segment = "argument"
-        self.vm_out.write("push " + segment.lower() + " " + str(index) + "\n")
+        self.write("push " + segment.lower() + " " + str(index) + "\n")
 
     def write_pop(self, segment: str, index: int) -> None:
         """Writes a VM pop command.
@@ -48,7 +101,7 @@ class VMWriter:
             segment = "constant"
         if segment == "ARG":
             segment = "argument"
-        self.vm_out.write("pop " + segment.lower() + " " + str(index) + "\n")
+        self.write("pop " + segment.lower() + " " + str(index) + "\n")
 
     def write_arithmetic(self, command: str) -> None:
         """Writes a VM arithmetic command.
@@ -58,7 +111,7 @@ class VMWriter:
             "EQ", "GT", "LT", "AND", "OR", "NOT", "SHIFTLEFT", "SHIFTRIGHT".
         """
         # Your code goes here!
-        self.vm_out.write(command.lower() + "\n")
+        self.write(command.lower() + "\n")
 
     def write_label(self, label: str) -> None:
         """Writes a VM label command.
@@ -67,7 +120,7 @@ class VMWriter:
             label (str): the label to write.
         """
         # Your code goes here!
-        self.vm_out.write("label " + label + "\n")
+        self.write("label " + label + "\n")
 
     def write_goto(self, label: str) -> None:
         """Writes a VM goto command.
@@ -76,7 +129,7 @@ class VMWriter:
             label (str): the label to go to.
         """
         # Your code goes here!
-        self.vm_out.write("goto " + label + "\n")
+        self.write("goto " + label + "\n")
 
     def write_if(self, label: str) -> None:
         """Writes a VM if-goto command.
@@ -85,7 +138,7 @@ class VMWriter:
             label (str): the label to go to.
         """
         # Your code goes here!
-        self.vm_out.write("if-goto " + label + "\n")
+        self.write("if-goto " + label + "\n")
 
     def write_call(self, name: str, n_args: int) -> None:
         """Writes a VM call command.
@@ -95,7 +148,7 @@ class VMWriter:
             n_args (int): the number of arguments the function receives.
         """
         # Your code goes here!
-        self.vm_out.write("call " + name + " " + str(n_args) + "\n")
+        self.write("call " + name + " " + str(n_args) + "\n")
 
     def write_function(self, name: str, n_locals: int) -> None:
         """Writes a VM function command.
@@ -105,9 +158,9 @@ class VMWriter:
             n_locals (int): the number of local variables the function uses.
         """
         # Your code goes here!
-        self.vm_out.write("function " + name + " " + str(n_locals) + "\n")
+        self.write("function " + name + " " + str(n_locals) + "\n")
 
     def write_return(self) -> None:
         """Writes a VM return command."""
         # Your code goes here!
-        self.vm_out.write("return\n")
+        self.write("return\n")
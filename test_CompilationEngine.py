@@ -0,0 +1,390 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import concurrent.futures
+import io
+import os
+
+import pytest
+
+from CompilationEngine import CompilationEngine
+from JackCompiler import RUNTIME_PATH
+from VMEmulator import VMEmulator
+
+# Levels of parentheses the baseline parser handled within Python's default
+# recursion limit.
+DEPTH = 450
+
+
+def compile_source(source: str, **options) -> str:
+    """
+    Args:
+        source (str): the Jack source code of a class.
+        **options: keyword arguments passed on to CompilationEngine.
+
+    Returns:
+        str: the VM code of the class.
+    """
+    output = io.StringIO()
+    CompilationEngine(io.StringIO(source), output, **options).compile_class()
+    return output.getvalue()
+
+
+def run(source: str, function: str, *arguments: int) -> int:
+    """Compiles a class and calls one of its functions, on top of the
+    shipped runtime classes.
+
+    Returns:
+        int: the value the function returned.
+    """
+    code = compile_source(source)
+    for class_name in ("Math", "Memory", "String"):
+        with open(os.path.join(RUNTIME_PATH, class_name + ".vm")) as vm_file:
+            code += vm_file.read()
+    emulator = VMEmulator(code)
+    emulator.call("Memory.init")
+    return emulator.call(function, *arguments)
+
+
+def test_array_store_survives_calls_in_its_value():
+    # Main.make stores into an array itself, which goes through temp 0.
+    source = """
+    class Main {
+        function int main() {
+            var Array a;
+            let a = Memory.alloc(3);
+            let a[1] = Main.make();
+            return a[1];
+        }
+        function int make() {
+            var Array b;
+            let b = Memory.alloc(2);
+            let b[0] = 7;
+            return 5;
+        }
+    }
+    """
+    assert run(source, "Main.main") == 5
+
+
+@pytest.mark.parametrize("precedence", [False, True])
+@pytest.mark.parametrize("expression, value", [
+    ("(" * DEPTH + "7" + ")" * DEPTH, 7),
+    ("(1 + " * DEPTH + "1" + ")" * DEPTH, DEPTH + 1),
+    ("-" * DEPTH + "2", 2)])
+def test_deeply_nested_expression(expression, value, precedence):
+    source = "class Main { function int main() { return %s; } }" % expression
+    code = compile_source(source, precedence=precedence)
+    assert VMEmulator(code).call("Main.main") == value
+
+
+def frame_size(code: str, function: str) -> int:
+    """Returns the number of locals the function command of function
+    declares in code.
+    """
+    for line in code.splitlines():
+        if line.startswith("function {} ".format(function)):
+            return int(line.split()[2])
+    raise KeyError(function)
+
+
+def test_dead_store_without_calls_is_dropped():
+    source = """
+    class Main {
+        function int main(int x) {
+            var int a, b;
+            let a = x + 1;
+            let b = x;
+            return b;
+        }
+    }
+    """
+    code = compile_source(source)
+    assert frame_size(code, "Main.main") == 0
+    assert "add" not in code
+    assert run(source, "Main.main", 4) == 4
+
+
+def test_dead_store_keeps_the_calls_it_makes():
+    source = """
+    class Main {
+        static int count;
+        function int main(int x) {
+            var int a;
+            let a = Main.count(x);
+            let a = Main.count(x);
+            return count;
+        }
+        function int count(int x) {
+            let count = count + x;
+            return count;
+        }
+    }
+    """
+    code = compile_source(source)
+    assert frame_size(code, "Main.main") == 0
+    assert code.count("call Main.count 1") == 2
+    assert run(source, "Main.main", 3) == 6
+
+
+@pytest.mark.parametrize("calls", ["", "do Main.nothing();"])
+def test_local_assigned_in_one_branch(calls):
+    # Without calls a is kept in a temp slot, which a new frame does not
+    # clear, so its entry value must be set explicitly.
+    source = """
+    class Main {
+        function int main(int x) {
+            var int a;
+            %s
+            if (x > 0) {
+                let a = 5;
+            }
+            return a;
+        }
+        function void nothing() {
+            return;
+        }
+        function int both() {
+            return Main.main(1) + Main.main(-1);
+        }
+    }
+    """ % calls
+    assert run(source, "Main.both") == 5
+
+
+def test_locals_live_around_a_loop():
+    # last is read in the iteration after the one assigning it, and t is
+    # never read at all.
+    source = """
+    class Main {
+        function int main(int n) {
+            var int last, previous, t;
+            let previous = 0;
+            while (n > 0) {
+                let previous = last;
+                let last = n;
+                let t = n;
+                let n = n - 1;
+            }
+            return previous;
+        }
+    }
+    """
+    assert frame_size(compile_source(source), "Main.main") == 0
+    assert run(source, "Main.main", 3) == 2
+    assert run(source, "Main.main", 1) == 0
+
+
+def test_self_tail_call_clears_entry_live_locals():
+    # a keeps the 100 of the call with n = 2 unless the jump back to the
+    # entry clears it, as a new frame would.
+    source = """
+    class Main {
+        function int main(int n, int sum) {
+            var int a;
+            if (n = 0) {
+                return sum + a;
+            }
+            if (n = 2) {
+                let a = 100;
+                let sum = sum + a;
+            }
+            return Main.main(n - 1, sum + 1);
+        }
+    }
+    """
+    code = compile_source(source)
+    assert "call Main.main" not in code
+    assert run(source, "Main.main", 3, 0) == 103
+    # Deep enough to overflow the emulated RAM with one frame per call.
+    assert run(source, "Main.main", 10000, 0) == 10100
+
+
+def truth(value: int) -> int:
+    """Returns the Jack boolean for a Python truth value."""
+    return -1 if value else 0
+
+
+# Conditions over a, b and c, with what they mean in Python. Jack applies
+# operators strictly left to right, so "~a = b" compares ~a with b.
+CONDITIONS = [
+    ("~a = b", lambda a, b, c: ~a == b),
+    ("~(a < b) = c", lambda a, b, c: ~truth(a < b) == c),
+    ("~(a < b)", lambda a, b, c: not a < b),
+    ("~(a = b)", lambda a, b, c: a != b),
+    ("a & 1", lambda a, b, c: a & 1),
+    ("~(a & 1)", lambda a, b, c: ~(a & 1)),
+    ("a", lambda a, b, c: a)]
+
+OPERANDS = [(a, b, c) for a in (-2, -1, 0, 1, 5)
+            for b in (-6, -1, 0, 1, 5) for c in (-1, 0)]
+
+
+@pytest.mark.parametrize("condition, meaning", CONDITIONS)
+def test_if_condition(condition, meaning):
+    source = """
+    class Main {
+        function int main(int a, int b, int c) {
+            if (%s) {
+                return 1;
+            } else {
+                return 2;
+            }
+        }
+    }
+    """ % condition
+    emulator = VMEmulator(compile_source(source))
+    for a, b, c in OPERANDS:
+        expected = 1 if meaning(a, b, c) else 2
+        assert emulator.call("Main.main", a, b, c) == expected, (a, b, c)
+
+
+@pytest.mark.parametrize("condition, meaning", CONDITIONS)
+def test_while_condition(condition, meaning):
+    source = """
+    class Main {
+        function int main(int a, int b, int c) {
+            while (%s) {
+                return 1;
+            }
+            return 0;
+        }
+    }
+    """ % condition
+    emulator = VMEmulator(compile_source(source))
+    for a, b, c in OPERANDS:
+        expected = 1 if meaning(a, b, c) else 0
+        assert emulator.call("Main.main", a, b, c) == expected, (a, b, c)
+
+
+def test_while_loops_on_any_nonzero_value():
+    # The baseline left the loop on any value other than true (-1).
+    source = """
+    class Main {
+        function int main(int n) {
+            var int count;
+            while (n & 7) {
+                let n = n + 1;
+                let count = count + 1;
+            }
+            return count;
+        }
+    }
+    """
+    assert run(source, "Main.main", 3) == 5
+    assert run(source, "Main.main", 8) == 0
+
+
+def test_constant_conditions():
+    source = """
+    class Main {
+        function int loop(int n) {
+            while (true) {
+                if (n > 3) {
+                    return n;
+                }
+                let n = n + 1;
+            }
+            return -1;
+        }
+        function int branch() {
+            var int x;
+            if (false) {
+                let x = 1;
+            } else {
+                let x = 2;
+            }
+            while (false) {
+                let x = 3;
+            }
+            if (true) {
+                let x = x + 10;
+            }
+            return x;
+        }
+    }
+    """
+    code = compile_source(source)
+    assert "if-goto" not in code.split("function Main.branch")[1]
+    assert run(source, "Main.loop", 0) == 4
+    assert run(source, "Main.branch") == 12
+
+
+def test_source_map(tmp_path):
+    path = tmp_path / "Main.jack"
+    path.write_text(
+        "class Main {\n"
+        "    function int main(int n, int sum) {\n"
+        "        var int i;\n"
+        "        while (i < n) {\n"
+        "            let i = i + 1;\n"
+        "        }\n"
+        "        if (n = 0) {\n"
+        "            return sum;\n"
+        "        }\n"
+        "        return Main.main(n - 1, sum + i);\n"
+        "    }\n"
+        "}\n")
+    # Pairs of the first VM line of a run and the Jack line it maps to.
+    entries = [(1, 2), (3, 4), (5, 5), (9, 6), (10, 4), (14, 7), (19, 8),
+               (21, 9), (22, 10)]
+    for first_line in (1, 10):
+        output = io.StringIO()
+        source_map = io.StringIO()
+        with open(path) as input_file:
+            CompilationEngine(input_file, output, source_map=source_map,
+                              first_line=first_line).compile_class()
+        assert source_map.getvalue() == "".join(
+            "{} Main.jack:{}\n".format(vm_line + first_line - 1, jack_line)
+            for vm_line, jack_line in entries)
+    lines = output.getvalue().splitlines()
+    # The function entry and the self tail call's target map to the
+    # declaration, not to the var line before the first statement.
+    assert lines[:2] == ["function Main.main 1", "label TAIL_CALL"]
+    assert lines[13] == "push argument 0"
+    assert lines[31] == "goto TAIL_CALL"
+
+
+@pytest.mark.parametrize("shared_pool", [False, True])
+def test_parallel_compile_matches_sequential(tmp_path, shared_pool):
+    subroutines = "".join("""
+    method int f%d(int n) {
+        var int i, s;
+        while (i < n) {
+            if (~(i & 1)) {
+                let s = s + (i * %d);
+            }
+            let i = i + 1;
+        }
+        if (n > 100) {
+            return f%d(n - 1);
+        }
+        return s + count;
+    }
+    function String g%d() {
+        return "subroutine %d";
+    }
+""" % (i, i, i, i, i) for i in range(12))
+    path = tmp_path / "Main.jack"
+    path.write_text("class Main {\n    field int count;\n    static Array a;\n"
+                    "    constructor Main new() {\n        let count = 1;\n"
+                    "        return this;\n    }\n" + subroutines + "}\n")
+
+    def compile_with(**options) -> tuple:
+        output = io.StringIO()
+        source_map = io.StringIO()
+        with open(path) as input_file:
+            CompilationEngine(input_file, output, source_map=source_map,
+                              first_line=5, **options).compile_class()
+        return output.getvalue(), source_map.getvalue()
+
+    if shared_pool:
+        with concurrent.futures.ProcessPoolExecutor(2) as pool:
+            parallel = compile_with(jobs=2, pool=pool)
+    else:
+        parallel = compile_with(jobs=2)
+    assert parallel == compile_with()
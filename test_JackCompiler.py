@@ -0,0 +1,87 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from JackCompiler import RUNTIME_PATH, compile_bundle
+from VMEmulator import VMEmulator
+
+MAIN = """class Main {
+    function int main() {
+        return Util.twice(3);
+    }
+}
+"""
+
+UTIL = """class Util {
+    function int twice(int x) {
+        return x + x;
+    }
+}
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    """A directory holding a two-class program."""
+    directory = tmp_path / "Project"
+    directory.mkdir()
+    (directory / "Main.jack").write_text(MAIN)
+    (directory / "Util.jack").write_text(UTIL)
+    return directory
+
+
+def test_bundle_layout(project):
+    math_path = os.path.join(RUNTIME_PATH, "Math.vm")
+    output = io.StringIO()
+    source_map = io.StringIO()
+    compile_bundle([str(project / "Main.jack"), str(project / "Util.jack")],
+                   output, [math_path], source_map=source_map)
+    lines = output.getvalue().splitlines()
+    assert lines[:12] == [
+        "// class Main",
+        "function Main.main 0",
+        "push constant 3",
+        "call Util.twice 1",
+        "return",
+        "// class Util",
+        "function Util.twice 0",
+        "push argument 0",
+        "push argument 0",
+        "add",
+        "return",
+        "// class Math"]
+    with open(math_path) as vm_file:
+        assert lines[12:] == vm_file.read().splitlines()
+    # Lines are counted across the class markers, and everything from the
+    # first runtime class on has no Jack source.
+    assert source_map.getvalue() == (
+        "2 Main.jack:2\n"
+        "3 Main.jack:3\n"
+        "7 Util.jack:2\n"
+        "8 Util.jack:3\n"
+        "12 -\n")
+    assert VMEmulator(output.getvalue()).call("Main.main") == 6
+
+
+def test_bundle_is_written_next_to_the_directory(project):
+    compiler = os.path.join(os.path.dirname(RUNTIME_PATH), "JackCompiler.py")
+    subprocess.run([sys.executable, compiler, "--bundle", "--source-map",
+                    str(project)], check=True)
+    assert sorted(os.listdir(project)) == ["Main.jack", "Util.jack"]
+    bundle = project.parent / "Project.vm"
+    output = io.StringIO()
+    compile_bundle([str(project / "Main.jack"), str(project / "Util.jack")],
+                   output, source_map=io.StringIO())
+    assert bundle.read_text() == output.getvalue()
+    assert (project.parent / "Project.vm.map").read_text().startswith(
+        "2 Main.jack:2\n")
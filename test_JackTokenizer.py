@@ -0,0 +1,90 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import time
+
+import pytest
+
+from JackTokenizer import JackTokenizer
+
+# Large enough that skipping comments in quadratic time would take minutes.
+SIZE = 200000
+# Wall-clock bound, in seconds, for tokenizing one input.
+TIME_LIMIT = 1.0
+
+
+def tokenize(source: str, memory_map: bool, tmp_path) -> list:
+    """
+    Args:
+        source (str): Jack source code.
+        memory_map (bool): whether to tokenize a memory-mapped file.
+        tmp_path: a directory for the memory-mapped file.
+
+    Returns:
+        list: the (type, value) pairs of the tokens of source.
+    """
+    if memory_map:
+        path = tmp_path / "Main.jack"
+        path.write_text(source)
+        input_file = open(path)
+    else:
+        input_file = io.StringIO(source)
+    with input_file:
+        tokenizer = JackTokenizer(input_file, memory_map)
+        tokens = []
+        while tokenizer.has_more_tokens():
+            tokenizer.advance()
+            tokens.append((tokenizer.token_type(), tokenizer.current_value))
+    return tokens
+
+
+def timed_tokenize(source: str, memory_map: bool, tmp_path) -> list:
+    """Like tokenize, but fails if tokenizing takes longer than TIME_LIMIT."""
+    start = time.perf_counter()
+    tokens = tokenize(source, memory_map, tmp_path)
+    assert time.perf_counter() - start < TIME_LIMIT
+    return tokens
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_comment_of_stars_and_newlines(memory_map, tmp_path):
+    source = "let /*" + "**\n" * SIZE + "*/ x;"
+    assert timed_tokenize(source, memory_map, tmp_path) == [
+        ("KEYWORD", "let"), ("IDENTIFIER", "x"), ("SYMBOL", ";")]
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_unterminated_comment_of_stars_and_newlines(memory_map, tmp_path):
+    source = "let /*" + "**\n" * SIZE
+    assert timed_tokenize(source, memory_map, tmp_path) == [
+        ("KEYWORD", "let")]
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_repeated_unterminated_comments(memory_map, tmp_path):
+    source = "return /*" * SIZE
+    assert timed_tokenize(source, memory_map, tmp_path) == [
+        ("KEYWORD", "return")]
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_comment_markers_in_string_constants(memory_map, tmp_path):
+    source = 'do f("a // b", "/* c */", "d /*");\n' * 1000
+    tokens = timed_tokenize(source, memory_map, tmp_path)
+    assert tokens[:10] == [
+        ("KEYWORD", "do"), ("IDENTIFIER", "f"), ("SYMBOL", "("),
+        ("STRING_CONST", "a // b"), ("SYMBOL", ","),
+        ("STRING_CONST", "/* c */"), ("SYMBOL", ","),
+        ("STRING_CONST", "d /*"), ("SYMBOL", ")"), ("SYMBOL", ";")]
+    assert tokens == tokens[:10] * 1000
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_unexpected_character(memory_map, tmp_path):
+    with pytest.raises(ValueError):
+        tokenize("let x = 1 @ 2;", memory_map, tmp_path)
@@ -0,0 +1,69 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+
+import pytest
+
+from JackCompiler import RUNTIME_PATH
+from VMBinary import MAX_OPERAND, VMBinary
+
+
+def round_trip(text: str) -> str:
+    """Converts VM text to the binary format and back."""
+    return VMBinary.from_bytes(VMBinary.from_text(text).to_bytes()).to_text()
+
+
+@pytest.mark.parametrize("class_name", ["Math", "Memory", "String"])
+def test_runtime_class_round_trip(class_name):
+    with open(os.path.join(RUNTIME_PATH, class_name + ".vm")) as vm_file:
+        text = vm_file.read()
+    assert round_trip(text) == text
+
+
+def test_every_command_round_trips():
+    text = (
+        "// class Main\n"
+        "function Main.main 2\n"
+        "push constant 32767\n"
+        "pop local 1\n"
+        "push argument 0\n"
+        "pop static 3\n"
+        "push this 2\n"
+        "pop that 0\n"
+        "push pointer 1\n"
+        "pop temp 7\n"
+        "add\nsub\nneg\neq\ngt\nlt\nand\nor\nnot\nshiftleft\nshiftright\n"
+        "label WHILE0\n"
+        "goto WHILE0\n"
+        "if-goto IF_END0\n"
+        "call Math.multiply 2\n"
+        "return\n")
+    assert round_trip(text) == text
+
+
+def test_trailing_comments_and_blank_lines_are_dropped():
+    assert round_trip("push constant 1 // one\n\n  add\n") == \
+        "push constant 1\nadd\n"
+
+
+def test_bytes_round_trip():
+    data = VMBinary.from_text("function Main.main 0\nreturn\n").to_bytes()
+    assert VMBinary.from_bytes(data).to_bytes() == data
+
+
+def test_not_a_binary_program():
+    with pytest.raises(ValueError):
+        VMBinary.from_bytes(b"VM00" + bytes(8))
+
+
+def test_string_table_full():
+    program = VMBinary()
+    for code in range(MAX_OPERAND + 1):
+        program.add("label L{}".format(code))
+    with pytest.raises(ValueError):
+        program.add("label L{}".format(MAX_OPERAND + 1))
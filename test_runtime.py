@@ -0,0 +1,110 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+import random
+
+import pytest
+
+from JackCompiler import RUNTIME_PATH, runtime_classes
+from VMEmulator import VMEmulator, word
+
+# The heap's first block, past the list heads and the footer after them.
+HEAP_START = 2048 + 65
+HEAP_END = 16384
+
+
+@pytest.fixture
+def runtime() -> VMEmulator:
+    """The shipped runtime classes, with the heap initialized."""
+    code = ""
+    for class_name in ("Math", "Memory", "String"):
+        with open(os.path.join(RUNTIME_PATH, class_name + ".vm")) as vm_file:
+            code += vm_file.read()
+    emulator = VMEmulator(code)
+    emulator.call("Memory.init")
+    return emulator
+
+
+def test_program_classes_take_precedence(tmp_path):
+    (tmp_path / "Main.jack").write_text("class Main {}")
+    (tmp_path / "String.jack").write_text("class String {}")
+    (tmp_path / "Memory.vm").write_text("function Memory.alloc 0\n")
+    # A runtime class copied by an earlier compile is still the runtime's.
+    with open(os.path.join(RUNTIME_PATH, "Math.vm")) as vm_file:
+        (tmp_path / "Math.vm").write_text(vm_file.read())
+    assert runtime_classes(str(tmp_path)) == [
+        os.path.join(RUNTIME_PATH, "Math.vm")]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_alloc_and_free_churn(runtime, seed):
+    # At most 8 blocks of up to 128 words are live at once, about 1,000
+    # words, so the heap never runs out unless freed blocks are lost.
+    rng = random.Random(seed)
+    live = []
+    for _ in range(20000):
+        if len(live) < 8 and (not live or rng.random() < 0.5):
+            live.append(runtime.call("Memory.alloc", rng.randint(1, 128)))
+        else:
+            runtime.call("Memory.deAlloc", live.pop(rng.randrange(len(live))))
+    for block in live:
+        runtime.call("Memory.deAlloc", block)
+    # Everything was merged back into the top of the heap.
+    assert runtime.call("Memory.alloc", HEAP_END - HEAP_START - 2) == \
+        HEAP_START + 1
+
+
+def test_small_request_splits_a_long_free_block(runtime):
+    first = runtime.call("Memory.alloc", 100)
+    runtime.call("Memory.alloc", HEAP_END - HEAP_START - 102 - 2)
+    runtime.call("Memory.deAlloc", first)
+    assert runtime.call("Memory.alloc", 10) == first
+    assert runtime.call("Memory.alloc", 10) == first + 12
+
+
+def test_neighbouring_free_blocks_merge(runtime):
+    blocks = [runtime.call("Memory.alloc", 20) for _ in range(4)]
+    runtime.call("Memory.alloc", HEAP_END - HEAP_START - 4 * 22 - 2)
+    for block in blocks[1:3] + blocks[:1]:
+        runtime.call("Memory.deAlloc", block)
+    assert runtime.call("Memory.alloc", 3 * 22 - 2) == blocks[0]
+
+
+def test_heap_exhausted(runtime):
+    with pytest.raises(RuntimeError, match=r"Sys.error\(6\)"):
+        runtime.call("Memory.alloc", HEAP_END - HEAP_START)
+
+
+@pytest.mark.parametrize("x, y, quotient", [
+    (-32768, 1, -32768), (-32768, 2, -16384), (-32768, 3, -10922),
+    (-32768, -2, 16384), (-32768, 32767, -1), (-32768, -32768, 1),
+    (32767, -32768, 0), (-32767, -32768, 0), (-7, 2, -3), (7, -2, -3),
+    (-7, -2, 3), (100, 7, 14), (0, -5, 0)])
+def test_divide(runtime, x, y, quotient):
+    assert runtime.call("Math.divide", x, y) == quotient
+
+
+@pytest.mark.parametrize("value", [
+    -32768, -32767, -10000, -9, -1, 0, 7, 10, 12345, 32767])
+def test_set_int_and_int_value(runtime, value):
+    string = runtime.call("String.new", 6)
+    runtime.call("String.setInt", string, value)
+    chars = [chr(runtime.call("String.charAt", string, j))
+             for j in range(runtime.call("String.length", string))]
+    assert "".join(chars) == str(value)
+    assert runtime.call("String.intValue", string) == value
+
+
+def test_multiply(runtime):
+    rng = random.Random(0)
+    operands = [-32768, -32767, -1, 0, 1, 2, 181, 32767]
+    pairs = [(x, y) for x in operands for y in operands] + [
+        (rng.randint(-32768, 32767), rng.randint(-32768, 32767))
+        for _ in range(200)]
+    for x, y in pairs:
+        assert runtime.call("Math.multiply", x, y) == word(x * y)